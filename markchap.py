@@ -6,13 +6,67 @@ markchap - Markdownファイルに章番号と図表番号を付与するツー
 import os
 import json
 import argparse
+import bisect
+import functools
+import hashlib
 import re
-from typing import List, Dict, Any, Tuple
+import pickle
+from collections import OrderedDict
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Sequence, Tuple
 from dataclasses import dataclass
-from markdown_it import MarkdownIt
 
+if TYPE_CHECKING:
+    # markdown-itは解析が必要になった時点で読み込む（--helpやエラー終了時は不要）
+    from markdown_it import MarkdownIt
+    from markdown_it.token import Token
 
-@dataclass
+try:
+    # orjsonがインストールされていれば設定ファイルの読み込みに使う（任意の依存）
+    import orjson as _json
+except ImportError:
+    _json = json
+
+# 図表検出用の正規表現（行頭の空白に続く画像・表コメントを内容全体から一度に探す）
+# 行単位で判定していた頃と同じ結果になるよう、改行をまたいでマッチさせない
+# 表のキャプションは最初の '>' までを貪欲に取り、末尾の '--' と空白は戻して捨てる
+# （最短一致と空白の組み合わせによる過剰なバックトラックを避けるため）
+_FIGURE_LINE_RE = re.compile(
+    r'^[^\S\n]*(?:'
+    r'(?P<image>!\[(?P<alt>[^\]\n]*)\]\([^)\n]+\))'
+    r'|(?P<table><!--[^\S\n]*表[^\S\n]*:[^\S\n]*(?P<caption>[^>\n]+)-->)'
+    r')',
+    re.M,
+)
+
+# 解析キャッシュのエントリ: ((st_mtime_ns, st_size), 内容, トークン)
+ParseCacheEntry = Tuple[Tuple[int, int], str, List["Token"]]
+
+# 見出しトークンのタグ -> 見出しレベル（int(tag[1])の部分文字列・整数変換を省く）
+_HEADING_LEVELS = {f"h{level}": level for level in range(1, 7)}
+
+# 見出しレベルごとの見出し記号（level回の '#' を毎回生成しないよう事前に用意）
+_HEADING_MARKS = tuple("#" * level for level in range(7))
+
+# 処理対象とするMarkdownファイルの拡張子
+MARKDOWN_SUFFIXES = (".md",)
+
+# 解析結果キャッシュの設定（出力ディレクトリではなくユーザーごとのキャッシュディレクトリに置く）
+PARSE_CACHE_MAX_ENTRIES = 4096
+# キャッシュ形式のバージョン（markdown-itのバージョンと合わせてキャッシュに記録する）
+PARSE_CACHE_FORMAT = 1
+
+# 進捗を表示するファイル数の間隔
+PROGRESS_INTERVAL = 50
+
+# 出力ファイルを書き込むスレッド数と、書き込み待ちにできるファイル数の上限
+OUTPUT_WRITER_THREADS = 2
+OUTPUT_QUEUE_SIZE = 16
+
+
+@dataclass(slots=True)
 class Heading:
     """見出し情報"""
 
@@ -25,7 +79,7 @@ class Heading:
     number: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class Figure:
     """図表情報"""
 
@@ -38,7 +92,7 @@ class Figure:
     figure_number: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class NumberState:
     """番号管理状態"""
 
@@ -56,11 +110,25 @@ class ConfigManager:
         self.config_path = config_path
         self.config = self._load_config()
 
+        # 頻繁に参照する設定値は属性として保持
+        self.excluded_headings: Tuple[str, ...] = tuple(
+            self.config.get("excluded_headings", ())
+        )
+        self.output_directory: str = self.config.get("output_directory", "mdbuild")
+        self.max_workers: Optional[int] = self._validate_max_workers(
+            self.config.get("max_workers")
+        )
+
     def _load_config(self) -> Dict[str, Any]:
         """設定ファイルを読み込み"""
         try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(self.config_path, "rb") as f:
+                data = f.read()
+            if _json is json:
+                # 標準のjsonはbytesを渡すとBOMを読み飛ばしてしまうため、orjsonと同じく
+                # BOM付きのファイルを拒否するよう明示的にUTF-8としてデコードしてから渡す
+                return json.loads(data.decode("utf-8"))
+            return _json.loads(data)
         except FileNotFoundError:
             print(
                 f"設定ファイル {self.config_path} が見つかりません。デフォルト設定を使用します。"
@@ -70,6 +138,17 @@ class ConfigManager:
             print(f"設定ファイルの読み込みエラー: {e}")
             return self._get_default_config()
 
+    @staticmethod
+    def _validate_max_workers(value: Any) -> Optional[int]:
+        """max_workersの値を検証（不正な値の場合は警告してNone＝CPUコア数とする）"""
+        if value is None:
+            return None
+        # boolはintのサブクラスなので明示的に除く
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            print(f"警告: max_workers の値 {value!r} は無効です。CPUコア数を使用します。")
+            return None
+        return value
+
     def _get_default_config(self) -> Dict[str, Any]:
         """デフォルト設定を返す"""
         return {
@@ -87,6 +166,7 @@ class ConfigManager:
             "number_formats": {"chapter": "{}", "figure": "図{}", "table": "表{}"},
             "output_directory": "mdbuild",
             "preserve_existing_numbers": True,
+            "max_workers": None,
         }
 
     def get(self, key: str, default: Any = None) -> Any:
@@ -94,54 +174,339 @@ class ConfigManager:
         return self.config.get(key, default)
 
 
+def _decode_text(data: bytes) -> str:
+    """UTF-8のバイト列を文字列に変換（テキストモードと同じく改行をLFに統一）"""
+    text = data.decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _read_text(file_path: str) -> Tuple[os.stat_result, str]:
+    """ファイルをバイト列として一括で読み込み、statと内容を返す
+
+    TextIOWrapperによる逐次デコードを避け、C実装のデコーダで一度に変換する。
+    """
+    with open(file_path, "rb") as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    return st, _decode_text(data)
+
+
+def _default_cache_dir() -> str:
+    """解析キャッシュの既定の保存先（$XDG_CACHE_HOME/markchap または ~/.cache/markchap）"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "markchap")
+
+
+def _parse_cache_version() -> Tuple[int, str]:
+    """キャッシュ形式とmarkdown-itのバージョン（異なる場合は保存済みのトークンを使わない）"""
+    import markdown_it
+
+    return PARSE_CACHE_FORMAT, markdown_it.__version__
+
+
+def _parse_cache_filename(input_dir: str) -> str:
+    """解析キャッシュのファイル名
+
+    入力ディレクトリとバージョンごとに分け、他のディレクトリ・バージョンのファイルは開かない。
+    """
+    cache_format, markdown_it_version = _parse_cache_version()
+    dir_hash = hashlib.sha256(os.path.abspath(input_dir).encode("utf-8")).hexdigest()[:16]
+    return (
+        f"parse-cache-v{cache_format}-markdown-it-{markdown_it_version}-{dir_hash}.pickle"
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_markdown_it() -> "MarkdownIt":
+    """見出し抽出用のMarkdownItを取得（プロセス内で1つだけ生成して共有する）
+
+    見出しテキストはinlineトークンのcontentから取得し、子トークンは使わないため、
+    インライン解析（coreの"inline"・"text_join"ルール）を無効にしてブロック解析のみ行う。
+    """
+    from markdown_it import MarkdownIt
+
+    return MarkdownIt().disable(["inline", "text_join"])
+
+
+def _read_and_parse(file_path: str, md: "MarkdownIt") -> ParseCacheEntry:
+    """ファイルを読み込んで解析し、(キャッシュキー, 内容, トークン)を返す"""
+    st, content = _read_text(file_path)
+    return (st.st_mtime_ns, st.st_size), content, md.parse(content)
+
+
+def _init_parse_worker() -> None:
+    """ワーカープロセスの初期化（MarkdownItを最初のタスクより前に生成しておく）"""
+    _get_markdown_it()
+
+
+def _parse_worker(file_path: str) -> Optional[ParseCacheEntry]:
+    """ワーカープロセスでファイルを解析（失敗した場合はNone）"""
+    try:
+        return _read_and_parse(file_path, _get_markdown_it())
+    except Exception:
+        # エラーの報告は親プロセスでの逐次処理に任せる
+        return None
+
+
 class MarkdownParser:
     """Markdownパーサー（markdown-it-pyベース）"""
 
     def __init__(self, config: ConfigManager):
         self.config = config
-        self.md = MarkdownIt()
+        # 見出しが除外語そのものという最も多いケースは集合の参照だけで判定する
+        self._excluded_exact = frozenset(config.excluded_headings)
+        self._excluded_re = self._compile_excluded_pattern(config.excluded_headings)
+        # 絶対パス -> 解析キャッシュのエントリ
+        self._parse_cache: "OrderedDict[str, ParseCacheEntry]" = OrderedDict()
+        # 保存後にキャッシュの内容が変わったか（変わっていなければ保存を省略する）
+        self._cache_dirty = False
+
+    @property
+    def md(self) -> "MarkdownIt":
+        """MarkdownItインスタンス（全ファイルがキャッシュ済みなら生成しない）"""
+        return _get_markdown_it()
+
+    @staticmethod
+    def _compile_excluded_pattern(
+        excluded_headings: Sequence[str],
+    ) -> Optional[re.Pattern]:
+        """除外見出しのリストを1つの正規表現にまとめる（空の場合はNone）"""
+        if not excluded_headings:
+            return None
+        return re.compile("|".join(re.escape(word) for word in excluded_headings))
 
     def parse_file(
         self, file_path: str
-    ) -> Tuple[List[Heading], List[Figure], List[Any]]:
-        """ファイルを解析して見出し・図表・トークンを抽出"""
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+    ) -> Tuple[List[Heading], List[Figure], List["Token"]]:
+        """ファイルを解析して見出し・図表・トークンを抽出
+
+        更新時刻とサイズが変わっていないファイルはキャッシュ済みのトークンを再利用し、
+        markdown-itによる解析を省略する。見出し・図表は呼び出し側で書き換えられるため、
+        毎回キャッシュから新しく生成する。
+        """
+        headings, figures, tokens, _ = self.parse_file_with_content(file_path)
+        return headings, figures, tokens
+
+    def parse_file_with_content(
+        self, file_path: str
+    ) -> Tuple[List[Heading], List[Figure], List["Token"], str]:
+        """parse_fileと同じ処理を行い、見出し・図表の抽出元になった内容も返す"""
+        cache_key = os.path.abspath(file_path)
+        cached = self._get_cached(cache_key)
+        if cached is not None:
+            self._parse_cache.move_to_end(cache_key)
+            _, content, tokens = cached
+        else:
+            entry = _read_and_parse(file_path, self.md)
+            self._store_cache_entry(cache_key, entry)
+            _, content, tokens = entry
 
-        tokens = self.md.parse(content)
         headings = self._extract_headings(tokens)
         figures = self._extract_figures_from_content(content)
 
-        return headings, figures, tokens
+        return headings, figures, tokens, content
+
+    def get_content(self, file_path: str) -> str:
+        """ファイルの内容を取得（解析済みで変更がなければキャッシュから返す）"""
+        cached = self._get_cached(os.path.abspath(file_path))
+        if cached is not None:
+            return cached[1]
+        _, content = _read_text(file_path)
+        return content
+
+    def prefetch(self, file_paths: List[str], max_workers: Optional[int] = None) -> None:
+        """キャッシュにないファイルを複数プロセスで並列に解析してキャッシュに格納
+
+        番号付与はファイル間で連続するため順番に行う必要があるが、
+        markdown-itによる解析はファイルごとに独立しているため先に並列で済ませておく。
+        解析に失敗したファイルはキャッシュせず、parse_file側で改めて処理させる。
+        """
+        pending = [
+            path for path in file_paths if self._get_cached(os.path.abspath(path)) is None
+        ]
+        if len(pending) < 2:
+            return
+
+        # 未指定の場合はCPUコア数（ファイル数より多くは起動しない）。1プロセスしか
+        # 使えないならプロセス間通信の分だけ遅くなるため、プロセスプールは使わず
+        # このプロセスで解析する
+        workers = min(max_workers or os.cpu_count() or 1, len(pending))
+        if workers == 1:
+            self._parse_with_read_ahead(pending)
+            return
+
+        # 小さなファイルが大量にある場合のプロセス間通信を減らすため、まとめて渡す
+        # （件数はファイル数で抑えた後の、実際に起動するワーカー数から決める）
+        chunksize = max(1, len(pending) // (workers * 4))
 
-    def _extract_headings(self, tokens: List[Any]) -> List[Heading]:
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_parse_worker
+            ) as executor:
+                results = executor.map(_parse_worker, pending, chunksize=chunksize)
+                for path, entry in zip(pending, results):
+                    if entry is not None:
+                        self._store_cache_entry(os.path.abspath(path), entry)
+        except (OSError, BrokenProcessPool) as e:
+            # プロセスを起動できない環境では逐次解析に任せる
+            print(f"警告: 並列解析を利用できません: {e}")
+
+    def _parse_with_read_ahead(self, file_paths: List[str]) -> None:
+        """1プロセスで順に解析（次のファイルの読み込みを別スレッドで解析と重ねる）
+
+        ファイルの読み込み中はGILが解放されるため、ディスクの待ち時間を解析の裏に隠せる。
+        """
+        md = self.md
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            next_read = reader.submit(_read_text, file_paths[0])
+            for i, path in enumerate(file_paths):
+                current = next_read
+                if i + 1 < len(file_paths):
+                    next_read = reader.submit(_read_text, file_paths[i + 1])
+                try:
+                    st, content = current.result()
+                    tokens = md.parse(content)
+                except Exception:
+                    # エラーの報告はparse_fileでの処理に任せる
+                    continue
+                self._store_cache_entry(
+                    os.path.abspath(path),
+                    ((st.st_mtime_ns, st.st_size), content, tokens),
+                )
+
+    def _get_cached(self, cache_key: str) -> Optional[ParseCacheEntry]:
+        """ファイルが変更されていなければキャッシュ済みのエントリを返す
+
+        git checkout などで更新時刻だけが変わった場合に備え、サイズが同じなら
+        内容を読み直して比較し、一致すればトークンを再利用する。
+        """
+        cached = self._parse_cache.get(cache_key)
+        if cached is None:
+            return None
+        try:
+            st = os.stat(cache_key)
+        except OSError:
+            return None
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if cached[0] == stat_key:
+            return cached
+        if cached[0][1] != st.st_size:
+            return None
+        try:
+            st, content = _read_text(cache_key)
+        except (OSError, UnicodeDecodeError):
+            return None
+        if content != cached[1]:
+            return None
+        # 内容が同じなので、次回からstatだけで判定できるようキーを更新する
+        cached = ((st.st_mtime_ns, st.st_size), cached[1], cached[2])
+        self._parse_cache[cache_key] = cached
+        self._cache_dirty = True
+        return cached
+
+    def _store_cache_entry(self, file_path: str, entry: ParseCacheEntry) -> None:
+        """キャッシュにエントリを追加（上限を超えた場合は最も古いものを破棄）"""
+        self._parse_cache[file_path] = entry
+        self._parse_cache.move_to_end(file_path)
+        self._cache_dirty = True
+        while len(self._parse_cache) > PARSE_CACHE_MAX_ENTRIES:
+            self._parse_cache.popitem(last=False)
+
+    def load_cache(self, cache_path: str) -> None:
+        """前回実行時の解析キャッシュを読み込み（読めない場合は無視する）
+
+        読み込んだエントリは既存のキャッシュに追加する。同じファイルのエントリが
+        既にある場合はこのプロセスで解析した新しい方を残す。
+        """
+        try:
+            with open(cache_path, "rb") as f:
+                version, cache = pickle.load(f)
+        except Exception:
+            # 壊れた・互換性のないキャッシュは使わずに最初から解析する
+            return
+        if version != _parse_cache_version() or not isinstance(cache, OrderedDict):
+            return
+        # 読み込んだものを古い側に置き、既存のエントリを新しい側に残す
+        cache.update(self._parse_cache)
+        for key in self._parse_cache:
+            cache.move_to_end(key)
+        while len(cache) > PARSE_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+        self._parse_cache = cache
+
+    def prune_cache(self, file_paths: List[str]) -> None:
+        """指定したファイル以外のエントリをキャッシュから取り除く"""
+        keep = {os.path.abspath(path) for path in file_paths}
+        stale = [key for key in self._parse_cache if key not in keep]
+        for key in stale:
+            del self._parse_cache[key]
+        if stale:
+            self._cache_dirty = True
+
+    def save_cache(self, cache_path: str) -> None:
+        """解析キャッシュをファイルに保存（保存先のディレクトリは本人のみ読み書きできるよう作成）
+
+        前回の保存・読み込みから解析したファイルがなければ何もしない。
+        """
+        if not self._cache_dirty:
+            return
+        # 一時ファイルに書き込んでから置き換え、書き込み途中のキャッシュを読ませない
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), mode=0o700, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                pickle.dump(
+                    (_parse_cache_version(), self._parse_cache),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(temp_path, cache_path)
+            self._cache_dirty = False
+        except OSError as e:
+            print(f"警告: 解析キャッシュの保存に失敗しました: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _extract_headings(self, tokens: List["Token"]) -> List[Heading]:
         """ASTトークンから見出しを抽出"""
         headings = []
-        excluded_headings = self.config.get("excluded_headings", [])
+        append_heading = headings.append
+        excluded_exact = self._excluded_exact
+        excluded_re = self._excluded_re
+        heading_levels = _HEADING_LEVELS
+        last_index = len(tokens) - 1
 
         for i, token in enumerate(tokens):
-            if token.type == "heading_open":
-                level = int(token.tag[1])  # h1 -> 1, h2 -> 2
+            if token.type != "heading_open":
+                continue
 
-                # 次のトークンが見出しテキスト
-                if i + 1 < len(tokens) and tokens[i + 1].type == "inline":
-                    text_token = tokens[i + 1]
-                    text = text_token.content.strip()
+            # 次のトークンが見出しテキスト
+            if i < last_index and tokens[i + 1].type == "inline":
+                level = heading_levels[token.tag]  # h1 -> 1, h2 -> 2
+                text = tokens[i + 1].content.strip()
+                line_map = token.map
 
-                    # 除外見出しの判定
-                    is_excluded = any(
-                        excluded in text for excluded in excluded_headings
-                    )
+                # 除外見出しの判定
+                is_excluded = text in excluded_exact or (
+                    excluded_re is not None and excluded_re.search(text) is not None
+                )
 
-                    heading = Heading(
+                append_heading(
+                    Heading(
                         level=level,
                         text=text,
                         raw_text=text,  # 元のテキストを保存
                         token_index=i,
-                        line_number=token.map[0] if token.map else 0,
+                        line_number=line_map[0] if line_map else 0,
                         is_excluded=is_excluded,
                     )
-                    headings.append(heading)
+                )
 
         return headings
 
@@ -149,38 +514,40 @@ class MarkdownParser:
     def _extract_figures_from_content(self, content: str) -> List[Figure]:
         """ファイルの内容から直接図表を抽出"""
         figures = []
-        lines = content.split('\n')
-        
-        for i, line in enumerate(lines):
-            line = line.strip()
-            
-            # 画像の検出
-            image_match = re.match(r'!\[([^\]]*)\]\(([^)]+)\)', line)
-            if image_match:
-                caption = image_match.group(1)
-                src = image_match.group(2)
+        append_figure = figures.append
+        count_newlines = content.count
+        find_newline = content.find
+        line_number = 1
+        last_pos = 0
+
+        for match in _FIGURE_LINE_RE.finditer(content):
+            start = match.start("image") if match.group("image") else match.start("table")
+            line_number += count_newlines("\n", last_pos, start)
+            last_pos = start
+
+            line_end = find_newline("\n", start)
+            original_text = content[start:line_end if line_end >= 0 else len(content)].rstrip()
+
+            if match.group("image"):
+                # 画像の検出
                 figure = Figure(
                     type="figure",
-                    original_text=line,
-                    caption=caption,
+                    original_text=original_text,
+                    caption=match.group("alt"),
                     token_index=0,  # 仮の値
-                    line_number=i + 1,
+                    line_number=line_number,
                 )
-                figures.append(figure)
-            
-            # 表の検出
-            table_match = re.match(r'<!--\s*表\s*:\s*([^>]+)\s*-->', line)
-            if table_match:
-                caption = table_match.group(1).strip()
+            else:
+                # 表の検出
                 figure = Figure(
                     type="table",
-                    original_text=line,
-                    caption=caption,
+                    original_text=original_text,
+                    caption=match.group("caption").strip(),
                     token_index=0,  # 仮の値
-                    line_number=i + 1,
+                    line_number=line_number,
                 )
-                figures.append(figure)
-        
+            append_figure(figure)
+
         return figures
 
 
@@ -194,6 +561,15 @@ class NumberingManager:
 
     def process_headings(self, headings: List[Heading]) -> None:
         """見出しに章番号を付与"""
+        state = self.state
+        # 番号リストはその場で伸縮させ、見出しごとに新しいリストを作らない
+        numbers = state.current_numbers
+        # prefixes[k]はnumbers[:k + 1]に対応する番号文字列（0のレベルは親と同じ）
+        # 番号を増やしたレベルの文字列だけを作り直し、見出しごとに全体を結合しない
+        prefixes: List[str] = []
+        for num in numbers:
+            self._append_prefix(prefixes, num)
+
         for heading in headings:
             if heading.is_excluded:
                 continue
@@ -201,88 +577,135 @@ class NumberingManager:
             # 章番号の計算
             level = heading.level
 
-            # 現在の番号リストを調整
-            if len(self.state.current_numbers) < level:
+            # 現在の番号リストを調整（調整後の長さは常にlevelになる）
+            depth = len(numbers)
+            if depth < level:
                 # レベルが深くなった場合、新しいレベルを追加
-                self.state.current_numbers.extend(
-                    [0] * (level - len(self.state.current_numbers))
-                )
-            elif len(self.state.current_numbers) > level:
-                # レベルが浅くなった場合、余分なレベルを削除
-                self.state.current_numbers = self.state.current_numbers[:level]
-
-            # 現在のレベルの番号を増加
-            self.state.current_numbers[level - 1] += 1
-
-            # それより深いレベルをリセット
-            for i in range(level, len(self.state.current_numbers)):
-                self.state.current_numbers[i] = 0
-
-            # 番号文字列を生成
-            number_parts = [
-                str(num) for num in self.state.current_numbers[:level] if num > 0
-            ]
-            heading.number = ".".join(number_parts)
+                numbers.extend([0] * (level - depth))
+                for _ in range(level - depth):
+                    self._append_prefix(prefixes, 0)
+            elif depth > level:
+                # レベルが浅くなった場合、余分なレベル（より深いレベル）を削除
+                del numbers[level:]
+                del prefixes[level:]
+
+            # 現在のレベルの番号を増加し、そのレベルの番号文字列だけを作り直す
+            numbers[level - 1] += 1
+            del prefixes[level - 1]
+            self._append_prefix(prefixes, numbers[level - 1])
+
+            # 番号文字列（飛ばされたレベルの0は含めない）
+            heading.number = prefixes[level - 1]
 
             # 図表番号のリセット（章が変わった場合）
             # 注意: 実際の図表番号管理は_assign_figure_numbersで行われる
             if level == 1:
-                self.state.figure_count = 0
-                self.state.table_count = 0
-
+                state.figure_count = 0
+                state.table_count = 0
+
+    @staticmethod
+    def _append_prefix(prefixes: List[str], num: int) -> None:
+        """1つ深いレベルの番号文字列を追加"""
+        parent = prefixes[-1] if prefixes else ""
+        if num <= 0:
+            prefixes.append(parent)
+        elif parent:
+            prefixes.append(f"{parent}.{num}")
+        else:
+            prefixes.append(str(num))
 
 
 class FileProcessor:
     """ファイル操作の管理"""
 
-    def __init__(self, config: ConfigManager):
+    def __init__(self, config: ConfigManager, output_dir: Optional[str] = None):
         self.config = config
-        self.output_dir = config.get("output_directory", "mdbuild")
+        # output_dirを指定した場合は設定ファイルのoutput_directoryより優先する
+        self.output_dir = output_dir or config.output_directory
+        # 作成済みの出力先ディレクトリ（同じディレクトリへのmakedirsを繰り返さない）
+        self._created_dirs = set()
 
     def get_markdown_files(self, input_dir: str) -> List[str]:
         """指定ディレクトリからMarkdownファイルを取得（辞書順）"""
         md_files = []
-        for root, dirs, files in os.walk(input_dir):
-            for file in sorted(files):
-                if file.endswith(".md"):
-                    md_files.append(os.path.join(root, file))
-        return sorted(md_files)
+        stack = [input_dir]
+        while stack:
+            for entry in self._scan_directory(stack.pop()):
+                if entry.name.endswith(MARKDOWN_SUFFIXES) and entry.is_file():
+                    md_files.append(entry.path)
+                elif entry.is_dir() and not entry.is_symlink():
+                    # os.walkと同様にシンボリックリンク先のディレクトリは辿らない
+                    stack.append(entry.path)
+        md_files.sort()
+        return md_files
 
     def prepare_output_directory(self, input_dir: str) -> None:
-        """出力ディレクトリの準備"""
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-
-        # 入力ディレクトリの構造を再現（出力ディレクトリは除外）
-        for root, dirs, files in os.walk(input_dir):
-            # 出力ディレクトリを除外
-            if self.output_dir in dirs:
-                dirs.remove(self.output_dir)
-            
-            for dir_name in dirs:
-                input_path = os.path.join(root, dir_name)
-                relative_path = os.path.relpath(input_path, input_dir)
-                output_path = os.path.join(self.output_dir, relative_path)
-                if not os.path.exists(output_path):
-                    os.makedirs(output_path)
+        """出力ディレクトリの準備
+
+        サブディレクトリは入力ディレクトリを走査して事前に作らず、
+        書き込み時に出力ファイルの置き場所として必要になったものだけ作成する。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._created_dirs = {self.output_dir}
+
+    @staticmethod
+    def _relative_path(path: str, base: str) -> str:
+        """baseからの相対パスを取得
+
+        走査で得たパスはbaseを先頭に持つため、その場合は切り出すだけで済ませ、
+        os.path.relpathによる正規化（getcwdの呼び出しを含む）を省く。
+        """
+        prefix = os.path.join(base, "")
+        if path.startswith(prefix):
+            return path[len(prefix):]
+        return os.path.relpath(path, base)
+
+    @staticmethod
+    def _scan_directory(path: str) -> List[os.DirEntry]:
+        """ディレクトリのエントリ一覧を取得（読めないディレクトリは空として扱う）"""
+        try:
+            with os.scandir(path) as it:
+                return list(it)
+        except OSError:
+            return []
 
     def write_output_file(self, input_file: str, input_dir: str, content: str) -> None:
         """出力ファイルの書き込み"""
-        relative_path = os.path.relpath(input_file, input_dir)
+        relative_path = self._relative_path(input_file, input_dir)
         output_file = os.path.join(self.output_dir, relative_path)
+        output_subdir = os.path.dirname(output_file)
+        if output_subdir not in self._created_dirs:
+            os.makedirs(output_subdir, exist_ok=True)
+            self._created_dirs.add(output_subdir)
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(content)
+        # 文字列は一度にエンコードし、テキスト層・バッファを通さず書き込む
+        if os.linesep != "\n":
+            content = content.replace("\n", os.linesep)
+        data = memoryview(content.encode("utf-8"))
+        with open(output_file, "wb", buffering=0) as f:
+            while data:
+                data = data[f.write(data):]
 
 
 class MarkchapCore:
     """メイン処理の制御"""
 
-    def __init__(self, config_path: str = "config.json"):
+    def __init__(
+        self,
+        config_path: str = "config.json",
+        output_dir: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+    ):
         self.config = ConfigManager(config_path)
         self.parser = MarkdownParser(self.config)
         self.numbering = NumberingManager(self.config)
-        self.file_processor = FileProcessor(self.config)
+        self.file_processor = FileProcessor(self.config, output_dir)
+        # 解析キャッシュの保存先（指定がなければユーザーごとのキャッシュディレクトリ）
+        self.cache_dir = cache_dir or _default_cache_dir()
+        # process_directory実行中のみ使う書き込みスレッドと書き込み待ちの一覧
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._pending_writes: List[Tuple[str, Future]] = []
+        self._write_slots = threading.BoundedSemaphore(OUTPUT_QUEUE_SIZE)
 
     def process_directory(self, input_dir: str) -> None:
         """ディレクトリ全体を処理"""
@@ -297,14 +720,42 @@ class MarkchapCore:
             return
 
         print(f"処理対象ファイル数: {len(md_files)}")
+        self.process_files(md_files, input_dir)
+
+    def process_files(self, file_paths: List[str], input_dir: str) -> None:
+        """指定したMarkdownファイルを順に処理（ディレクトリの走査は行わない）
 
+        input_dirは出力先の相対パスの基準になる。章番号はfile_pathsの順に連番で付与する。
+        """
         # 出力ディレクトリの準備
         self.file_processor.prepare_output_directory(input_dir)
 
-        # 各ファイルの処理
-        for file_path in md_files:
-            print(f"処理中: {file_path}")
-            self.process_file(file_path, input_dir)
+        # 前回実行時の解析キャッシュを読み込み
+        # （公開・共有されうる出力ディレクトリには置かず、ユーザーごとのディレクトリを使う。
+        #   入力ディレクトリごとに別のファイルにし、他のプロジェクトのエントリは読み込まない）
+        cache_path = os.path.join(self.cache_dir, _parse_cache_filename(input_dir))
+        self.parser.load_cache(cache_path)
+
+        # 解析のみ先に並列実行しておく（番号付与は以下で順番に行う）
+        self.parser.prefetch(file_paths, self.config.max_workers)
+
+        # 各ファイルの処理（書き込みは別スレッドで行い、次のファイルの処理と重ねる）
+        total = len(file_paths)
+        with ThreadPoolExecutor(max_workers=OUTPUT_WRITER_THREADS) as writer:
+            self._writer = writer
+            try:
+                for i, file_path in enumerate(file_paths, 1):
+                    # 進捗表示は一定件数ごと（と最後のファイル）に限定する
+                    if i == 1 or i % PROGRESS_INTERVAL == 0 or i == total:
+                        print(f"処理中: {i}/{total} {file_path}")
+                    self.process_file(file_path, input_dir)
+            finally:
+                self._writer = None
+        self._report_write_errors()
+
+        # 今回処理したファイルの分だけを保存する
+        self.parser.prune_cache(file_paths)
+        self.parser.save_cache(cache_path)
 
         print(
             f"処理完了。結果は '{self.file_processor.output_dir}' ディレクトリに保存されました。"
@@ -314,7 +765,8 @@ class MarkchapCore:
         """単一ファイルの処理"""
         try:
             # ファイルの解析
-            headings, figures, tokens = self.parser.parse_file(file_path)
+            # （行番号が内容と食い違わないよう、解析した内容そのものを置換に使う）
+            headings, figures, _, source = self.parser.parse_file_with_content(file_path)
 
             # 章番号の付与
             self.numbering.process_headings(headings)
@@ -322,111 +774,179 @@ class MarkchapCore:
             # 図表番号の付与
             self._assign_figure_numbers(figures, headings)
 
-            # 元のファイルを読み込み、直接置換
-            content = self._process_content_directly(file_path, headings, figures)
+            # 解析時に読み込んだ内容に対して直接置換（ファイルは再読み込みしない）
+            content = self._process_content_directly(source, headings, figures)
 
             # 出力ファイルの書き込み
-            self.file_processor.write_output_file(file_path, input_dir, content)
+            self._write_output(file_path, input_dir, content)
 
         except Exception as e:
             print(f"エラー: {file_path} の処理に失敗しました: {e}")
 
+    def _write_output(self, file_path: str, input_dir: str, content: str) -> None:
+        """出力ファイルを書き込み（process_directory中は書き込みスレッドに任せる）"""
+        if self._writer is None:
+            self.file_processor.write_output_file(file_path, input_dir, content)
+            return
+
+        # 書き込み待ちのファイルが溜まりすぎないよう、空きができるまで待つ
+        self._write_slots.acquire()
+        try:
+            future = self._writer.submit(
+                self.file_processor.write_output_file, file_path, input_dir, content
+            )
+        except BaseException:
+            self._write_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._write_slots.release())
+        self._pending_writes.append((file_path, future))
+
+    def _report_write_errors(self) -> None:
+        """書き込みスレッドで発生したエラーを表示"""
+        for file_path, future in self._pending_writes:
+            error = future.exception()
+            if error is not None:
+                print(f"エラー: {file_path} の処理に失敗しました: {error}")
+        self._pending_writes = []
+
     def _assign_figure_numbers(self, figures: List[Figure], headings: List[Heading]) -> None:
         """図表番号を適切に付与"""
-        # 各レベル2の見出し（小節）ごとに図表番号を管理
-        section_figure_count = {}
-        section_table_count = {}
-        
+        # 各レベル2の見出し（小節）ごとに図表番号を管理（図表タイプ -> 小節番号 -> 個数）
+        section_counts: Dict[str, Dict[str, int]] = {"figure": {}, "table": {}}
+
+        # 章・小節の見出しの行番号一覧（二分探索用、ファイル内の出現順なので昇順）
+        boundaries = [
+            heading
+            for heading in headings
+            if not heading.is_excluded and heading.number and heading.level <= 2
+        ]
+        section_lines = [heading.line_number for heading in boundaries]
+
+        # 各見出しの直後にある図表が属する小節番号
+        # （章の見出しの場合は、その章の最初の小節。小節がなければ「章番号.1」）
+        section_numbers = [""] * len(boundaries)
+        next_section = None
+        for i in range(len(boundaries) - 1, -1, -1):
+            heading = boundaries[i]
+            if heading.level == 2:
+                next_section = heading.number
+                section_numbers[i] = next_section
+            else:
+                section_numbers[i] = next_section or f"{heading.number}.1"
+                next_section = None
+        default_section = section_numbers[0] if section_numbers else "1.1"
+
         for figure in figures:
             # 図表の位置から対応する小節を見つける
-            current_section = self._find_section_for_figure(figure, headings)
+            current_section = self._find_section_for_figure(
+                figure, section_numbers, section_lines, default_section
+            )
             
             # 小節番号ごとに図表番号を管理
             figure.figure_number = self._get_next_figure_number(
-                figure.type, current_section, section_figure_count, section_table_count
+                figure.type, current_section, section_counts
             )
             figure.chapter_number = current_section
     
     def _get_next_figure_number(
-        self, 
-        figure_type: str, 
-        section: str, 
-        figure_count: Dict[str, int], 
-        table_count: Dict[str, int]
+        self,
+        figure_type: str,
+        section: str,
+        section_counts: Dict[str, Dict[str, int]],
     ) -> int:
         """次の図表番号を取得"""
-        if figure_type == "figure":
-            if section not in figure_count:
-                figure_count[section] = 0
-            figure_count[section] += 1
-            return figure_count[section]
-        elif figure_type == "table":
-            if section not in table_count:
-                table_count[section] = 0
-            table_count[section] += 1
-            return table_count[section]
-        else:
+        counts = section_counts.get(figure_type)
+        if counts is None:
             print(f"警告: 不明な図表タイプ: {figure_type}")
             return 1
-
-    def _find_section_for_figure(self, figure: Figure, headings: List[Heading]) -> str:
-        """図表に対応する小節を見つける"""
-        try:
-            for heading in headings:
-                if (not heading.is_excluded and 
-                    heading.number and 
-                    heading.level == 2 and  # レベル2の見出し（小節）
-                    heading.line_number <= figure.line_number):
-                    return heading.number
-        except (AttributeError, TypeError) as e:
-            print(f"警告: 図表の小節検索中にエラー: {e}")
-        
-        # デフォルト値を動的に取得
-        return self._get_default_section(headings)
-    
-    def _get_default_section(self, headings: List[Heading]) -> str:
-        """デフォルトの小節番号を取得"""
-        for heading in headings:
-            if not heading.is_excluded and heading.number and heading.level == 2:
-                return heading.number
-        return "1.1"  # フォールバック値
+        number = counts.get(section, 0) + 1
+        counts[section] = number
+        return number
+
+    def _find_section_for_figure(
+        self,
+        figure: Figure,
+        section_numbers: List[str],
+        section_lines: List[int],
+        default_section: str,
+    ) -> str:
+        """図表に対応する小節（直前にある章・小節の見出しから決まる小節）を見つける"""
+        # 見出しの行番号は0始まり、図表の行番号は1始まりなので揃えて比較する
+        index = bisect.bisect_right(section_lines, figure.line_number - 1) - 1
+        if index < 0:
+            # 見出しより前にある図表は最初の小節に属するものとして扱う
+            return default_section
+        return section_numbers[index]
 
     def _process_content_directly(
-        self, file_path: str, headings: List[Heading], figures: List[Figure]
+        self, content: str, headings: List[Heading], figures: List[Figure]
     ) -> str:
-        """元のファイルを直接処理して図表番号を付与"""
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        # 見出しの処理（逆順で実行）
-        for heading in reversed(headings):
-            if not heading.is_excluded and heading.number:
-                # 見出しの行を置換（元のテキストを使用）
-                old_pattern = f"{'#' * heading.level} {heading.raw_text}"
-                new_pattern = f"{'#' * heading.level} {heading.number}. {heading.raw_text}"
-                content = content.replace(old_pattern, new_pattern, 1)  # 1回だけ置換
-
-        # 図表の処理
-        for figure in figures:
-            if figure.figure_number > 0:
-                if figure.type == "figure":
-                    # 画像の処理 - altテキストを更新
-                    old_pattern = f"![{figure.caption}]"
-                    new_pattern = f"![図{figure.chapter_number}.{figure.figure_number}: {figure.caption}]"
-                    content = content.replace(old_pattern, new_pattern)
-                    
-                    # 画像の後にキャプションラベルを追加（空行を挟む）
-                    image_pattern = re.escape(f"![図{figure.chapter_number}.{figure.figure_number}: {figure.caption}]") + r"\([^)]+\)"
-                    caption_label = f"**図 {figure.chapter_number}.{figure.figure_number}: {figure.caption}**"
-                    replacement = r"\g<0>" + "\n\n" + caption_label
-                    content = re.sub(image_pattern, replacement, content)
-                elif figure.type == "table":
-                    # 表の処理 - コメントをキャプション形式に変換
-                    old_pattern = f"<!-- 表: {figure.caption} -->"
-                    new_pattern = f"**表{figure.chapter_number}.{figure.figure_number}: {figure.caption}**"
-                    content = content.replace(old_pattern, new_pattern)
-
-        return content
+        """元のファイルの内容を直接処理して図表番号を付与
+
+        見出し・図表はそれぞれ検出した行だけを書き換える。文書全体に対する置換を
+        見出し・図表の数だけ繰り返さないため、処理量はファイルサイズに比例する。
+        """
+        numbered_headings = [
+            heading for heading in headings if not heading.is_excluded and heading.number
+        ]
+        numbered_figures = [figure for figure in figures if figure.figure_number > 0]
+        if not numbered_headings and not numbered_figures:
+            # 書き換える行がなければ分割・結合による複製を行わない
+            return content
+
+        lines = content.split("\n")
+
+        # 見出しの処理（見出しの行番号は0始まり）
+        for heading in numbered_headings:
+            index = heading.line_number
+            if index < len(lines):
+                lines[index] = self._number_heading_line(lines[index], heading)
+
+        # 図表の処理（図表の行番号は1始まり）
+        for figure in numbered_figures:
+            index = figure.line_number - 1
+            if 0 <= index < len(lines):
+                lines[index] = self._number_figure_line(lines[index], figure)
+
+        return "\n".join(lines)
+
+    def _number_heading_line(self, line: str, heading: Heading) -> str:
+        """見出しの行に章番号を付与（元のテキストを使用）"""
+        prefix = _HEADING_MARKS[heading.level] + " "
+        old_pattern = prefix + heading.raw_text
+        new_pattern = prefix + heading.number + ". " + heading.raw_text
+        return line.replace(old_pattern, new_pattern, 1)
+
+    def _number_figure_line(self, line: str, figure: Figure) -> str:
+        """図表の行に図表番号を付与"""
+        label = f"{figure.chapter_number}.{figure.figure_number}"
+        if figure.type == "figure":
+            # 画像の処理 - altテキストを更新
+            old_pattern = "![" + figure.caption + "]"
+            start = line.find(old_pattern)
+            if start < 0:
+                return line
+            new_pattern = "![図" + label + ": " + figure.caption + "]"
+
+            # 画像の後にキャプションラベルを追加（空行を挟む）
+            end = line.find(")", start + len(old_pattern))
+            if end < 0:
+                return line[:start] + new_pattern + line[start + len(old_pattern):]
+            caption_label = "**図 " + label + ": " + figure.caption + "**"
+            return (
+                line[:start]
+                + new_pattern
+                + line[start + len(old_pattern):end + 1]
+                + "\n\n"
+                + caption_label
+                + line[end + 1:]
+            )
+        elif figure.type == "table":
+            # 表の処理 - コメントをキャプション形式に変換
+            old_pattern = "<!-- 表: " + figure.caption + " -->"
+            new_pattern = "**表" + label + ": " + figure.caption + "**"
+            return line.replace(old_pattern, new_pattern, 1)
+        return line
 
 def main():
     """メイン関数"""
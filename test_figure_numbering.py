@@ -6,21 +6,22 @@
 import unittest
 import tempfile
 import os
+import re
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock
 from markchap import MarkchapCore
 
+# メモリ上のファイルシステムがあれば一時ディレクトリをそこに作る（ディスクI/Oを避ける）
+TEMP_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
 
 class TestFigureNumbering(unittest.TestCase):
     """図表番号付与のテスト"""
 
-    def setUp(self):
-        """各テストの前に実行"""
-        self.test_dir = tempfile.mkdtemp()
-        self.output_dir = os.path.join(self.test_dir, "mdbuild")
-        self.config_path = os.path.join(self.test_dir, "config.json")
-        
-        # テスト用設定ファイルを作成
-        config_content = """{
+    # テスト用設定ファイルの内容（全テストで共通）
+    CONFIG_CONTENT = """{
   "excluded_headings": ["はじめに", "参考文献", "まとめ"],
   "number_formats": {
     "chapter": "{}",
@@ -30,13 +31,44 @@ class TestFigureNumbering(unittest.TestCase):
   "output_directory": "mdbuild",
   "preserve_existing_numbers": true
 }"""
-        with open(self.config_path, "w", encoding="utf-8") as f:
-            f.write(config_content)
+
+    @classmethod
+    def setUpClass(cls):
+        """クラス内の最初のテストの前に一度だけ実行"""
+        cls.class_dir = tempfile.mkdtemp(dir=TEMP_ROOT)
+        cls.config_path = os.path.join(cls.class_dir, "config.json")
+
+        # テスト用設定ファイルを作成（内容は共通なので一度だけ書き込む）
+        Path(cls.config_path).write_text(cls.CONFIG_CONTENT, encoding="utf-8")
+
+    @classmethod
+    def tearDownClass(cls):
+        """クラス内の全テストの後に一度だけ実行"""
+        shutil.rmtree(cls.class_dir)
+
+    def setUp(self):
+        """各テストの前に実行"""
+        # 入力・出力はテストごとのディレクトリに分ける
+        self.test_dir = tempfile.mkdtemp(dir=self.class_dir)
+        self.output_dir = os.path.join(self.test_dir, "mdbuild")
+        self.cache_dir = os.path.join(self.test_dir, "cache")
 
     def tearDown(self):
         """各テストの後に実行"""
         shutil.rmtree(self.test_dir)
 
+    def assertAllIn(self, expected, result):
+        """expectedのすべての文字列がresultに含まれることを確認
+
+        結果は1つの正規表現で一度だけ走査する。見つからなかった文字列
+        （他の期待値と重なって一致しなかったものを含む）はassertInで個別に確認する。
+        """
+        pattern = re.compile("|".join(re.escape(text) for text in expected))
+        found = set(pattern.findall(result))
+        for text in expected:
+            if text not in found:
+                self.assertIn(text, result)
+
     def test_basic_figure_numbering(self):
         """基本的な図表番号付与のテスト"""
         # テスト用markdownファイルを作成
@@ -69,31 +101,28 @@ class TestFigureNumbering(unittest.TestCase):
 | b    | 2 |
 """
         test_file = os.path.join(self.test_dir, "test.md")
-        with open(test_file, "w", encoding="utf-8") as f:
-            f.write(test_content)
+        Path(test_file).write_text(test_content, encoding="utf-8")
 
-        # markchapを実行
-        current_dir = os.getcwd()
-        os.chdir(self.test_dir)  # テストディレクトリに移動
-        try:
-            core = MarkchapCore(self.config_path)
-            core.process_directory(".")
-        finally:
-            os.chdir(current_dir)  # 元のディレクトリに戻る
+        # markchapを実行（カレントディレクトリは変更しない）
+        core = MarkchapCore(
+            self.config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+        core.process_files([test_file], self.test_dir)
 
         # 出力ファイルを確認
         output_file = os.path.join(self.test_dir, "mdbuild", "test.md")
         self.assertTrue(os.path.exists(output_file), f"出力ファイルが存在しません: {output_file}")
 
-        with open(output_file, "r", encoding="utf-8") as f:
-            result = f.read()
+        result = Path(output_file).read_text(encoding="utf-8")
 
         # 図表番号が正しく付与されていることを確認
-        self.assertIn("![図1.1.1: テスト画像1](image1.png)", result)
-        self.assertIn("<!-- 表1.1.1: テスト表1 -->", result)
-        self.assertIn("![図1.1.2: テスト画像2](image2.png)", result)
-        self.assertIn("![図1.2.1: テスト画像3](image3.png)", result)
-        self.assertIn("<!-- 表1.2.1: テスト表2 -->", result)
+        self.assertAllIn([
+            "![図1.1.1: テスト画像1](image1.png)",
+            "<!-- 表1.1.1: テスト表1 -->",
+            "![図1.1.2: テスト画像2](image2.png)",
+            "![図1.2.1: テスト画像3](image3.png)",
+            "<!-- 表1.2.1: テスト表2 -->",
+        ], result)
 
     def test_multiple_chapters(self):
         """複数章の図表番号付与のテスト"""
@@ -119,28 +148,25 @@ class TestFigureNumbering(unittest.TestCase):
 ![画像3](img3.png)
 """
         test_file = os.path.join(self.test_dir, "multi_chapter.md")
-        with open(test_file, "w", encoding="utf-8") as f:
-            f.write(test_content)
+        Path(test_file).write_text(test_content, encoding="utf-8")
 
-        # markchapを実行
-        current_dir = os.getcwd()
-        os.chdir(self.test_dir)  # テストディレクトリに移動
-        try:
-            core = MarkchapCore(self.config_path)
-            core.process_directory(".")
-        finally:
-            os.chdir(current_dir)  # 元のディレクトリに戻る
+        # markchapを実行（カレントディレクトリは変更しない）
+        core = MarkchapCore(
+            self.config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+        core.process_files([test_file], self.test_dir)
 
         # 出力ファイルを確認
         output_file = os.path.join(self.test_dir, "mdbuild", "multi_chapter.md")
-        with open(output_file, "r", encoding="utf-8") as f:
-            result = f.read()
+        result = Path(output_file).read_text(encoding="utf-8")
 
         # 図表番号が正しく付与されていることを確認
-        self.assertIn("![図1.1.1: 画像1](img1.png)", result)
-        self.assertIn("![図2.1.1: 画像2](img2.png)", result)
-        self.assertIn("<!-- 表2.1.1: 表1 -->", result)
-        self.assertIn("![図2.2.1: 画像3](img3.png)", result)
+        self.assertAllIn([
+            "![図1.1.1: 画像1](img1.png)",
+            "![図2.1.1: 画像2](img2.png)",
+            "<!-- 表2.1.1: 表1 -->",
+            "![図2.2.1: 画像3](img3.png)",
+        ], result)
 
     def test_excluded_headings(self):
         """除外見出しのテスト"""
@@ -163,22 +189,17 @@ class TestFigureNumbering(unittest.TestCase):
 ![除外画像2](excluded2.png)
 """
         test_file = os.path.join(self.test_dir, "excluded.md")
-        with open(test_file, "w", encoding="utf-8") as f:
-            f.write(test_content)
+        Path(test_file).write_text(test_content, encoding="utf-8")
 
-        # markchapを実行
-        current_dir = os.getcwd()
-        os.chdir(self.test_dir)  # テストディレクトリに移動
-        try:
-            core = MarkchapCore(self.config_path)
-            core.process_directory(".")
-        finally:
-            os.chdir(current_dir)  # 元のディレクトリに戻る
+        # markchapを実行（カレントディレクトリは変更しない）
+        core = MarkchapCore(
+            self.config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+        core.process_files([test_file], self.test_dir)
 
         # 出力ファイルを確認
         output_file = os.path.join(self.test_dir, "mdbuild", "excluded.md")
-        with open(output_file, "r", encoding="utf-8") as f:
-            result = f.read()
+        result = Path(output_file).read_text(encoding="utf-8")
 
         # 除外見出しには番号が付かないことを確認
         self.assertIn("# はじめに", result)
@@ -187,8 +208,10 @@ class TestFigureNumbering(unittest.TestCase):
         self.assertNotIn("# 2. まとめ", result)
         
         # 通常の見出しには番号が付くことを確認
-        self.assertIn("# 1. 第1章", result)
-        self.assertIn("![図1.1.1: 画像1](img1.png)", result)
+        self.assertAllIn([
+            "# 1. 第1章",
+            "![図1.1.1: 画像1](img1.png)",
+        ], result)
 
     def test_complex_numbering(self):
         """複雑な図表番号付与のテスト"""
@@ -227,31 +250,155 @@ class TestFigureNumbering(unittest.TestCase):
 ![画像4](img4.png)
 """
         test_file = os.path.join(self.test_dir, "complex.md")
-        with open(test_file, "w", encoding="utf-8") as f:
-            f.write(test_content)
+        Path(test_file).write_text(test_content, encoding="utf-8")
 
-        # markchapを実行
-        current_dir = os.getcwd()
-        os.chdir(self.test_dir)  # テストディレクトリに移動
-        try:
-            core = MarkchapCore(self.config_path)
-            core.process_directory(".")
-        finally:
-            os.chdir(current_dir)  # 元のディレクトリに戻る
+        # markchapを実行（カレントディレクトリは変更しない）
+        core = MarkchapCore(
+            self.config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+        core.process_files([test_file], self.test_dir)
 
         # 出力ファイルを確認
         output_file = os.path.join(self.test_dir, "mdbuild", "complex.md")
-        with open(output_file, "r", encoding="utf-8") as f:
-            result = f.read()
+        result = Path(output_file).read_text(encoding="utf-8")
 
         # 図表番号が正しく付与されていることを確認
-        self.assertIn("![図1.1.1: 画像1](img1.png)", result)
-        self.assertIn("![図1.1.2: 画像2](img2.png)", result)
-        self.assertIn("<!-- 表1.1.1: 表1 -->", result)
-        self.assertIn("![図1.1.3: 画像3](img3.png)", result)
-        self.assertIn("<!-- 表1.1.2: 表2 -->", result)
-        self.assertIn("<!-- 表1.1.3: 表3 -->", result)
-        self.assertIn("![図1.2.1: 画像4](img4.png)", result)
+        self.assertAllIn([
+            "![図1.1.1: 画像1](img1.png)",
+            "![図1.1.2: 画像2](img2.png)",
+            "<!-- 表1.1.1: 表1 -->",
+            "![図1.1.3: 画像3](img3.png)",
+            "<!-- 表1.1.2: 表2 -->",
+            "<!-- 表1.1.3: 表3 -->",
+            "![図1.2.1: 画像4](img4.png)",
+        ], result)
+
+    def test_figures_in_later_sections(self):
+        """2番目以降の小節にある図表は直前の小節の番号で数えるテスト"""
+        test_content = """# 第1章
+
+![小節前の画像](img0.png)
+
+## 節1
+
+![画像1](img1.png)
+
+## 節2
+
+![画像2](img2.png)
+
+![画像3](img3.png)
+
+## 節3
+
+![画像4](img4.png)
+
+# 第2章
+
+![2章の小節前の画像](img5.png)
+
+## 節1
+
+![画像6](img6.png)
+"""
+        test_file = os.path.join(self.test_dir, "sections.md")
+        Path(test_file).write_text(test_content, encoding="utf-8")
+
+        # markchapを実行（カレントディレクトリは変更しない）
+        core = MarkchapCore(
+            self.config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+        core.process_files([test_file], self.test_dir)
+
+        # 出力ファイルを確認
+        output_file = os.path.join(self.test_dir, "mdbuild", "sections.md")
+        result = Path(output_file).read_text(encoding="utf-8")
+
+        # 小節より前の図表はその章の最初の小節、それ以外は直前の小節に属することを確認
+        self.assertAllIn([
+            "![図1.1.1: 小節前の画像](img0.png)",
+            "![図1.1.2: 画像1](img1.png)",
+            "![図1.2.1: 画像2](img2.png)",
+            "![図1.2.2: 画像3](img3.png)",
+            "![図1.3.1: 画像4](img4.png)",
+            "![図2.1.1: 2章の小節前の画像](img5.png)",
+            "![図2.1.2: 画像6](img6.png)",
+        ], result)
+
+    def test_duplicate_headings_and_captions(self):
+        """同じ見出し・キャプションが複数ある場合のテスト"""
+        test_content = """# 第1章
+
+## 節
+
+![画像](img1.png)
+
+![画像](img2.png)
+
+```
+## 節
+```
+
+## 節
+
+![画像](img3.png)
+"""
+        test_file = os.path.join(self.test_dir, "duplicate.md")
+        Path(test_file).write_text(test_content, encoding="utf-8")
+
+        # markchapを実行（カレントディレクトリは変更しない）
+        core = MarkchapCore(
+            self.config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+        core.process_files([test_file], self.test_dir)
+
+        # 出力ファイルを確認
+        output_file = os.path.join(self.test_dir, "mdbuild", "duplicate.md")
+        result = Path(output_file).read_text(encoding="utf-8")
+
+        # 見出し・図表はそれぞれ出現順に番号が付与されることを確認
+        self.assertLess(result.index("## 1.1. 節"), result.index("## 1.2. 節"))
+        self.assertIn("```\n## 節\n```", result)  # コードブロック内は変更しない
+        self.assertAllIn([
+            "![図1.1.1: 画像](img1.png)",
+            "![図1.1.2: 画像](img2.png)",
+            "![図1.2.1: 画像](img3.png)",
+        ], result)
+
+    def test_parallel_parsing_across_files(self):
+        """複数プロセスで解析した場合も章・図表番号はファイルをまたいで連続するテスト"""
+        config_path = os.path.join(self.test_dir, "parallel.json")
+        Path(config_path).write_text('{"max_workers": 2}', encoding="utf-8")
+        input_dir = os.path.join(self.test_dir, "docs")
+        os.makedirs(input_dir)
+        Path(input_dir, "a.md").write_text(
+            "# 第1章\n\n## 節1\n\n![画像1](img1.png)\n", encoding="utf-8"
+        )
+        Path(input_dir, "b.md").write_text(
+            "# 第2章\n\n## 節1\n\n![画像2](img2.png)\n", encoding="utf-8"
+        )
+
+        core = MarkchapCore(
+            config_path, output_dir=self.output_dir, cache_dir=self.cache_dir
+        )
+
+        # 先読み解析でプロセスプールが使われ、両方のファイルがキャッシュに格納されることを確認
+        md_files = core.file_processor.get_markdown_files(input_dir)
+        with mock.patch("markchap.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool:
+            core.parser.prefetch(md_files, core.config.max_workers)
+        pool.assert_called_once()
+        self.assertEqual(pool.call_args.kwargs["max_workers"], 2)
+        for path in md_files:
+            self.assertIn(os.path.abspath(path), core.parser._parse_cache)
+
+        # markchapを実行
+        core.process_directory(input_dir)
+
+        # 2つ目のファイルの番号が1つ目の続きになっていることを確認
+        result_a = Path(self.output_dir, "a.md").read_text(encoding="utf-8")
+        result_b = Path(self.output_dir, "b.md").read_text(encoding="utf-8")
+        self.assertAllIn(["# 1. 第1章", "## 1.1. 節1", "![図1.1.1: 画像1](img1.png)"], result_a)
+        self.assertAllIn(["# 2. 第2章", "## 2.1. 節1", "![図2.1.1: 画像2](img2.png)"], result_b)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+MarkdownParser のテストケース
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from markchap import ConfigManager, MarkchapCore, MarkdownParser, _parse_cache_filename
+
+
+class TestParseCache(unittest.TestCase):
+    """解析キャッシュのテスト"""
+
+    def setUp(self):
+        """各テストの前に実行"""
+        self.test_dir = tempfile.mkdtemp()
+        self.config = ConfigManager(os.path.join(self.test_dir, "missing.json"))
+        self.test_file = os.path.join(self.test_dir, "test.md")
+        with open(self.test_file, "w", encoding="utf-8") as f:
+            f.write("# 第1章\n\n## 節1\n\n![画像](img.png)\n")
+
+    def tearDown(self):
+        """各テストの後に実行"""
+        shutil.rmtree(self.test_dir)
+
+    def test_unchanged_file_reuses_tokens(self):
+        """変更のないファイルは再解析しない"""
+        parser = MarkdownParser(self.config)
+        _, _, tokens1 = parser.parse_file(self.test_file)
+        headings, figures, tokens2 = parser.parse_file(self.test_file)
+
+        self.assertIs(tokens1, tokens2)
+        self.assertEqual([h.text for h in headings], ["第1章", "節1"])
+        self.assertEqual(len(figures), 1)
+
+    def test_cached_headings_are_fresh_objects(self):
+        """キャッシュ利用時も見出しは新しいオブジェクトとして返される"""
+        parser = MarkdownParser(self.config)
+        headings1, _, _ = parser.parse_file(self.test_file)
+        headings1[0].number = "1"
+        headings2, _, _ = parser.parse_file(self.test_file)
+
+        self.assertEqual(headings2[0].number, "")
+
+    def test_modified_file_is_reparsed(self):
+        """内容が変わったファイルは再解析される"""
+        parser = MarkdownParser(self.config)
+        parser.parse_file(self.test_file)
+        with open(self.test_file, "w", encoding="utf-8") as f:
+            f.write("# 別の章\n")
+        headings, figures, _ = parser.parse_file(self.test_file)
+
+        self.assertEqual([h.text for h in headings], ["別の章"])
+        self.assertEqual(figures, [])
+
+    def test_touched_file_reuses_tokens(self):
+        """更新時刻だけが変わったファイルは内容を比較して再解析しない"""
+        parser = MarkdownParser(self.config)
+        _, _, tokens1 = parser.parse_file(self.test_file)
+        st = os.stat(self.test_file)
+        os.utime(self.test_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        _, _, tokens2 = parser.parse_file(self.test_file)
+
+        self.assertIs(tokens1, tokens2)
+        cached = parser._parse_cache[os.path.abspath(self.test_file)]
+        self.assertEqual(cached[0][0], st.st_mtime_ns + 10**9)
+
+    def test_get_content_uses_parsed_content(self):
+        """解析済みファイルの内容はキャッシュから返される"""
+        parser = MarkdownParser(self.config)
+        parser.parse_file(self.test_file)
+        cached = parser._parse_cache[os.path.abspath(self.test_file)]
+
+        self.assertIs(parser.get_content(self.test_file), cached[1])
+
+    def test_process_file_uses_parsed_content(self):
+        """出力には見出し・図表を抽出したのと同じ内容が使われる"""
+        core = MarkchapCore(
+            os.path.join(self.test_dir, "missing.json"),
+            output_dir=os.path.join(self.test_dir, "mdbuild"),
+            cache_dir=os.path.join(self.test_dir, "cache"),
+        )
+        core.parser.get_content = None  # 解析後に内容を読み直さないことを確認する
+        core.process_file(self.test_file, self.test_dir)
+
+        with open(os.path.join(self.test_dir, "mdbuild", "test.md"), encoding="utf-8") as f:
+            result = f.read()
+        self.assertIn("## 1.1. 節1", result)
+        self.assertIn("![図1.1.1: 画像](img.png)", result)
+
+    def test_prefetch_single_worker(self):
+        """1プロセスでの先読み解析（読めないファイルはキャッシュしない）"""
+        other_file = os.path.join(self.test_dir, "other.md")
+        with open(other_file, "w", encoding="utf-8") as f:
+            f.write("# 第2章\n")
+        broken_file = os.path.join(self.test_dir, "broken.md")
+        with open(broken_file, "wb") as f:
+            f.write(b"\xff\xfe")
+        parser = MarkdownParser(self.config)
+        parser.prefetch([self.test_file, broken_file, other_file], max_workers=1)
+
+        self.assertIn(os.path.abspath(self.test_file), parser._parse_cache)
+        self.assertIn(os.path.abspath(other_file), parser._parse_cache)
+        self.assertNotIn(os.path.abspath(broken_file), parser._parse_cache)
+
+    def test_prefetch_pool_is_sized_by_pending_files(self):
+        """ワーカー数は解析するファイル数までに抑え、まとめて渡す件数もその数から決める"""
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.test_dir, f"doc{i}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"# 第{i + 1}章\n")
+            paths.append(path)
+        parser = MarkdownParser(self.config)
+        with mock.patch("markchap.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as pool, \
+                mock.patch.object(
+                    ProcessPoolExecutor, "map", autospec=True,
+                    side_effect=ProcessPoolExecutor.map,
+                ) as pool_map:
+            parser.prefetch(paths, max_workers=32)
+
+        self.assertEqual(pool.call_args.kwargs["max_workers"], 3)
+        self.assertEqual(pool_map.call_args.kwargs["chunksize"], 1)
+        for path in paths:
+            self.assertIn(os.path.abspath(path), parser._parse_cache)
+
+    def test_cache_round_trip(self):
+        """キャッシュの保存と読み込み"""
+        cache_path = os.path.join(self.test_dir, _parse_cache_filename(self.test_dir))
+        parser = MarkdownParser(self.config)
+        parser.parse_file(self.test_file)
+        parser.save_cache(cache_path)
+
+        restored = MarkdownParser(self.config)
+        restored.load_cache(cache_path)
+        headings, _, _ = restored.parse_file(self.test_file)
+
+        self.assertEqual(len(restored._parse_cache), 1)
+        self.assertEqual([h.text for h in headings], ["第1章", "節1"])
+
+    def test_load_cache_keeps_parsed_entries(self):
+        """キャッシュの読み込みで解析済みのエントリが失われない"""
+        cache_path = os.path.join(self.test_dir, _parse_cache_filename(self.test_dir))
+        other_file = os.path.join(self.test_dir, "other.md")
+        with open(other_file, "w", encoding="utf-8") as f:
+            f.write("# 第2章\n")
+        parser = MarkdownParser(self.config)
+        parser.parse_file(other_file)
+        parser.save_cache(cache_path)
+
+        restored = MarkdownParser(self.config)
+        restored.parse_file(self.test_file)
+        restored.load_cache(cache_path)
+
+        self.assertIn(os.path.abspath(self.test_file), restored._parse_cache)
+        self.assertIn(os.path.abspath(other_file), restored._parse_cache)
+
+    def test_unchanged_cache_is_not_saved(self):
+        """解析したファイルがなければキャッシュを書き直さない"""
+        cache_path = os.path.join(self.test_dir, _parse_cache_filename(self.test_dir))
+        parser = MarkdownParser(self.config)
+        parser.parse_file(self.test_file)
+        parser.save_cache(cache_path)
+        os.remove(cache_path)
+
+        parser.parse_file(self.test_file)
+        parser.save_cache(cache_path)
+
+        self.assertFalse(os.path.exists(cache_path))
+
+    def test_corrupt_cache_is_ignored(self):
+        """壊れたキャッシュファイルは無視される"""
+        cache_path = os.path.join(self.test_dir, _parse_cache_filename(self.test_dir))
+        with open(cache_path, "wb") as f:
+            f.write(b"not a pickle")
+        parser = MarkdownParser(self.config)
+        parser.load_cache(cache_path)
+
+        headings, _, _ = parser.parse_file(self.test_file)
+        self.assertEqual(len(headings), 2)
+
+    def test_cache_from_other_version_is_ignored(self):
+        """バージョンの異なるキャッシュは読み込まない"""
+        cache_path = os.path.join(self.test_dir, _parse_cache_filename(self.test_dir))
+        with open(cache_path, "wb") as f:
+            pickle.dump((("old", "0.0.0"), OrderedDict(a=1)), f)
+        parser = MarkdownParser(self.config)
+        parser.load_cache(cache_path)
+
+        self.assertEqual(len(parser._parse_cache), 0)
+
+    def test_cache_is_not_written_to_output_directory(self):
+        """解析キャッシュは出力ディレクトリではなく指定したキャッシュディレクトリに保存される"""
+        output_dir = os.path.join(self.test_dir, "mdbuild")
+        cache_dir = os.path.join(self.test_dir, "cache")
+        core = MarkchapCore(
+            os.path.join(self.test_dir, "missing.json"),
+            output_dir=output_dir,
+            cache_dir=cache_dir,
+        )
+        core.process_files([self.test_file], self.test_dir)
+
+        self.assertEqual(os.listdir(output_dir), ["test.md"])
+        self.assertEqual(os.listdir(cache_dir), [_parse_cache_filename(self.test_dir)])
+
+    def test_cache_is_kept_per_input_directory(self):
+        """別の入力ディレクトリの実行では他のディレクトリのエントリを読み込まず、保存もしない"""
+        cache_dir = os.path.join(self.test_dir, "cache")
+        input_dirs = []
+        for name in ("a", "b"):
+            input_dir = os.path.join(self.test_dir, name)
+            os.makedirs(input_dir)
+            with open(os.path.join(input_dir, f"{name}.md"), "w", encoding="utf-8") as f:
+                f.write("# 第1章\n")
+            input_dirs.append(input_dir)
+        dir_a, dir_b = input_dirs
+        file_a = os.path.join(dir_a, "a.md")
+        file_b = os.path.join(dir_b, "b.md")
+
+        def run(input_dir, file_path):
+            core = MarkchapCore(
+                os.path.join(self.test_dir, "missing.json"),
+                output_dir=os.path.join(input_dir, "mdbuild"),
+                cache_dir=cache_dir,
+            )
+            core.process_files([file_path], input_dir)
+            return core
+
+        run(dir_a, file_a)
+        cache_a = os.path.join(cache_dir, _parse_cache_filename(dir_a))
+        with open(cache_a, "rb") as f:
+            saved_a = f.read()
+
+        core_b = run(dir_b, file_b)
+        self.assertEqual(list(core_b.parser._parse_cache), [os.path.abspath(file_b)])
+        with open(os.path.join(cache_dir, _parse_cache_filename(dir_b)), "rb") as f:
+            _, cache_b = pickle.load(f)
+        self.assertEqual(list(cache_b), [os.path.abspath(file_b)])
+        with open(cache_a, "rb") as f:
+            self.assertEqual(f.read(), saved_a)
+
+
+class TestConfigManager(unittest.TestCase):
+    """設定ファイルの読み込み・検証のテスト"""
+
+    def setUp(self):
+        """各テストの前に実行"""
+        self.test_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.test_dir, "config.json")
+
+    def tearDown(self):
+        """各テストの後に実行"""
+        shutil.rmtree(self.test_dir)
+
+    def load_max_workers(self, value):
+        """指定した値を書き込んだ設定ファイルを読み込み、max_workersを返す"""
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            f.write('{"max_workers": %s}' % value)
+        return ConfigManager(self.config_path).max_workers
+
+    def test_valid_value(self):
+        """正の整数はそのまま使われる"""
+        self.assertEqual(self.load_max_workers("2"), 2)
+        self.assertIsNone(self.load_max_workers("null"))
+
+    def test_zero_falls_back_to_default(self):
+        """1未満の値はNone（CPUコア数）になる"""
+        self.assertIsNone(self.load_max_workers("0"))
+        self.assertIsNone(self.load_max_workers("-1"))
+
+    def test_non_integer_falls_back_to_default(self):
+        """整数以外の値はNone（CPUコア数）になる"""
+        self.assertIsNone(self.load_max_workers('"4"'))
+        self.assertIsNone(self.load_max_workers("1.5"))
+        self.assertIsNone(self.load_max_workers("true"))
+
+    def test_bom_is_rejected(self):
+        """BOM付きの設定ファイルはorjsonの有無にかかわらずデフォルト設定になる"""
+        with open(self.config_path, "wb") as f:
+            f.write(b'\xef\xbb\xbf{"output_directory": "custom"}')
+
+        self.assertEqual(ConfigManager(self.config_path).output_directory, "mdbuild")
+
+
+if __name__ == "__main__":
+    unittest.main()